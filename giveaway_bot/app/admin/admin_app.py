@@ -1,99 +1,230 @@
+import asyncio
+import hmac
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+import stat
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
-from passlib.hash import bcrypt
-from itsdangerous import URLSafeSerializer
-from sqlalchemy import select
-from ..db import Base, engine, SessionLocal
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from itsdangerous import URLSafeTimedSerializer
+import orjson
+from sqlalchemy import select, func, bindparam
+from ..db import async_engine, AsyncSessionLocal, init_db, insert_ignore
 from ..models import Giveaway, PromoCode
+from ..env import BASE_DIR, load as _load_env
 
-app = FastAPI()
+_load_env()
 
-# Load .env reliably both locally and on server
-BASE_DIR = Path(__file__).resolve().parents[2]  # .../giveaway_bot
-ENV_PATH = BASE_DIR / ".env"
-load_dotenv(ENV_PATH if ENV_PATH.exists() else None)
+_db_ready = False
 
-templates = Jinja2Templates(directory=str(BASE_DIR / "app" / "admin" / "templates"))
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables once per process; set RUN_CREATE_ALL=0 when the schema is managed elsewhere
+    global _db_ready
+    if not _db_ready and os.getenv("RUN_CREATE_ALL", "1") == "1":
+        async with async_engine.begin() as conn:
+            await conn.run_sync(init_db)
+        _db_ready = True
+    yield
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Templates never change while the process is running: compile each one once
+# and skip the per-request mtime check. Compiled bytecode is also kept on disk
+# so worker restarts don't recompile (Jinja never purges it — clean up by cron).
+def _bytecode_cache() -> FileSystemBytecodeCache:
+    cache_dir = os.getenv("JINJA_CACHE_DIR", "").strip()
+    if not cache_dir:
+        # Jinja's default: per-user dir in tmp, created 0700 and ownership-checked
+        return FileSystemBytecodeCache()
+    # cached bytecode is unmarshalled and executed — nobody else may write here
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    st = os.lstat(cache_dir)
+    if (
+        not stat.S_ISDIR(st.st_mode)
+        or (hasattr(os, "getuid") and st.st_uid != os.getuid())
+        or st.st_mode & 0o022
+    ):
+        raise RuntimeError(f"JINJA_CACHE_DIR {cache_dir!r} must be a directory owned by this user and not writable by others")
+    return FileSystemBytecodeCache(cache_dir, "%s.cache")
+
+jinja_env = Environment(
+    loader=FileSystemLoader(str(BASE_DIR / "app" / "admin" / "templates")),
+    autoescape=select_autoescape(),
+    auto_reload=False,
+    cache_size=400,
+    bytecode_cache=_bytecode_cache(),
+)
+for _name in ("dashboard.html", "login.html", "giveaway_form.html", "codes.html"):
+    jinja_env.get_template(_name)
+templates = Jinja2Templates(env=jinja_env)
 
 ADMIN_LOGIN = os.getenv("ADMIN_LOGIN", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin12345")
 SECRET = os.getenv("ADMIN_SECRET", "supersecret")
-serializer = URLSafeSerializer(SECRET)
 
-Base.metadata.create_all(bind=engine)
+# Hash once at startup (or take a ready hash from ADMIN_PASSWORD_HASH)
+argon2_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH", "").strip() or argon2_hasher.hash(ADMIN_PASSWORD)
+SESSION_MAX_AGE = int(os.getenv("ADMIN_SESSION_MAX_AGE", str(8 * 3600)))  # seconds
+class _OrjsonText:
+    # orjson as a text serializer, so serializer.dumps() keeps returning str
+    @staticmethod
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    loads = staticmethod(orjson.loads)
+
+serializer = URLSafeTimedSerializer(SECRET, salt="admin-session", serializer=_OrjsonText)
+
+PAGE_SIZE = 50
+MAX_PAGE = 100_000  # keeps page * PAGE_SIZE a sane SQL OFFSET
+
+# List queries are built once and reused; per-request values are bound params.
+# Only the columns the templates show — plain rows, no ORM objects.
+# Promo code counts come from the same query (no per-row lookups).
+_STMT_GIVEAWAYS = (
+    select(
+        Giveaway.id,
+        Giveaway.title,
+        Giveaway.winners_count,
+        Giveaway.is_active,
+        func.count(PromoCode.id).label("n_codes"),
+    )
+    .outerjoin(PromoCode, PromoCode.giveaway_id == Giveaway.id)
+    .group_by(Giveaway.id)
+    .order_by(Giveaway.id.desc())
+    .limit(bindparam("limit"))
+    .offset(bindparam("offset"))
+)
+
+_STMT_CODES = (
+    select(PromoCode.code, PromoCode.uses, PromoCode.max_uses, PromoCode.is_active)
+    .where(PromoCode.giveaway_id == bindparam("gid"))
+    .order_by(PromoCode.id.desc())
+    .limit(bindparam("limit"))
+    .offset(bindparam("offset"))
+)
+
+# Same cookie comes back on every request of a session — remember the signed
+# issue time instead of re-checking the signature each time. Expiry is
+# checked outside the cache, so cached cookies still age out.
+@lru_cache(maxsize=1024)
+def _cookie_issued_at(cookie: str) -> float | None:
+    try:
+        data, issued = serializer.loads(cookie, return_timestamp=True)
+        return issued.timestamp() if data.get("u") == ADMIN_LOGIN else None
+    except Exception:
+        return None
 
 def is_authed(request: Request) -> bool:
     cookie = request.cookies.get("session", "")
     if not cookie:
         return False
-    try:
-        data = serializer.loads(cookie)
-        return data.get("u") == ADMIN_LOGIN
-    except Exception:
-        return False
+    issued = _cookie_issued_at(cookie)
+    return issued is not None and time.time() - issued < SESSION_MAX_AGE
 
-@app.get("/", response_class=HTMLResponse)
-def root(request: Request):
+def require_auth(request: Request) -> None:
     if not is_authed(request):
-        return RedirectResponse("/login", status_code=302)
-    with SessionLocal() as db:
-        giveaways = db.execute(select(Giveaway).order_by(Giveaway.id.desc())).scalars().all()
-    return templates.TemplateResponse("dashboard.html", {"request": request, "giveaways": giveaways})
+        raise HTTPException(status_code=302, headers={"Location": "/login"})
+
+@app.get("/", response_class=HTMLResponse)
+async def root(request: Request, page: int = Query(0, ge=0, le=MAX_PAGE), _: None = Depends(require_auth)):
+    async with AsyncSessionLocal() as db:
+        # one extra row tells us whether there is a next page
+        result = await db.execute(_STMT_GIVEAWAYS, {"limit": PAGE_SIZE + 1, "offset": page * PAGE_SIZE})
+        giveaways = result.all()
+    return templates.TemplateResponse("dashboard.html", {
+        "request": request,
+        "giveaways": giveaways[:PAGE_SIZE],
+        "page": page,
+        "has_next": len(giveaways) > PAGE_SIZE,
+    })
 
 @app.get("/login", response_class=HTMLResponse)
 def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request, "err": ""})
 
+def verify_password(password: str) -> bool:
+    try:
+        return argon2_hasher.verify(ADMIN_PASSWORD_HASH, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
 @app.post("/login")
-def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    # простий логін (MVP)
-    if username == ADMIN_LOGIN and password == ADMIN_PASSWORD:
+async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    # argon2 is CPU-heavy — run it in a thread so the event loop keeps serving
+    user_ok = hmac.compare_digest(username.encode(), ADMIN_LOGIN.encode())
+    pass_ok = await asyncio.to_thread(verify_password, password)
+    if user_ok and pass_ok:
         cookie = serializer.dumps({"u": username})
         resp = RedirectResponse("/", status_code=302)
-        resp.set_cookie("session", cookie, httponly=True)
+        resp.set_cookie("session", cookie, httponly=True, max_age=SESSION_MAX_AGE)
         return resp
     return templates.TemplateResponse("login.html", {"request": request, "err": "Невірний логін/пароль"})
 
 @app.get("/giveaway/new", response_class=HTMLResponse)
-def giveaway_new(request: Request):
-    if not is_authed(request):
-        return RedirectResponse("/login", status_code=302)
+def giveaway_new(request: Request, _: None = Depends(require_auth)):
     return templates.TemplateResponse("giveaway_form.html", {"request": request})
 
 @app.post("/giveaway/new")
-def giveaway_create(
+async def giveaway_create(
         request: Request,
         title: str = Form(...),
         description: str = Form(""),
         winners_count: int = Form(1),
         channel_username: str = Form(""),
+        _: None = Depends(require_auth),
 ):
-    if not is_authed(request):
-        return RedirectResponse("/login", status_code=302)
-    with SessionLocal() as db:
-        g = Giveaway(title=title, description=description, winners_count=winners_count, channel_username=channel_username, is_active=True)
-        db.add(g)
-        db.commit()
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            g = Giveaway(title=title, description=description, winners_count=winners_count, channel_username=channel_username, is_active=True)
+            db.add(g)
     return RedirectResponse("/", status_code=302)
 
 @app.get("/codes/{giveaway_id}", response_class=HTMLResponse)
-def codes_page(request: Request, giveaway_id: int):
-    if not is_authed(request):
-        return RedirectResponse("/login", status_code=302)
-    with SessionLocal() as db:
-        codes = db.execute(select(PromoCode).where(PromoCode.giveaway_id==giveaway_id).order_by(PromoCode.id.desc())).scalars().all()
-    return templates.TemplateResponse("codes.html", {"request": request, "codes": codes, "giveaway_id": giveaway_id})
+async def codes_page(
+        request: Request,
+        giveaway_id: int,
+        page: int = Query(0, ge=0, le=MAX_PAGE),
+        _: None = Depends(require_auth),
+):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            _STMT_CODES, {"gid": giveaway_id, "limit": PAGE_SIZE + 1, "offset": page * PAGE_SIZE}
+        )
+        codes = result.all()
+    return templates.TemplateResponse("codes.html", {
+        "request": request,
+        "codes": codes[:PAGE_SIZE],
+        "giveaway_id": giveaway_id,
+        "page": page,
+        "has_next": len(codes) > PAGE_SIZE,
+    })
 
 @app.post("/codes/{giveaway_id}")
-def codes_create(request: Request, giveaway_id: int, code: str = Form(...), max_uses: int = Form(1)):
-    if not is_authed(request):
-        return RedirectResponse("/login", status_code=302)
-    with SessionLocal() as db:
-        pc = PromoCode(giveaway_id=giveaway_id, code=code.strip(), max_uses=max_uses, uses=0, is_active=True)
-        db.add(pc)
-        db.commit()
+async def codes_create(
+        request: Request,
+        giveaway_id: int,
+        code: str = Form(...),
+        max_uses: int = Form(1),
+        _: None = Depends(require_auth),
+):
+    # one code per line; duplicates (in the input or already in DB) are skipped
+    values = list(dict.fromkeys(c.strip() for c in code.splitlines() if c.strip()))
+    if values:
+        async with AsyncSessionLocal() as db:
+            async with db.begin():
+                await db.execute(
+                    insert_ignore(PromoCode, ["giveaway_id", "code"]),
+                    [
+                        {"giveaway_id": giveaway_id, "code": c, "max_uses": max_uses, "uses": 0, "is_active": True}
+                        for c in values
+                    ],
+                )
     return RedirectResponse(f"/codes/{giveaway_id}", status_code=302)
@@ -1,30 +1,44 @@
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
 
 def looks_like_fake(user) -> bool:
     # Дуже базово. Потім можна посилити.
     # user.is_bot — якщо true, одразу відсікаємо.
-    if getattr(user, "is_bot", False):
-        return True
-
     # Якщо нема ні username, ні імені — підозріло (але не 100%).
-    if not user.username and not user.first_name:
-        return True
-
-    return False
+    return bool(user.is_bot or not (user.username or user.first_name))
 
 class SimpleRateLimit:
-    def __init__(self):
-        self._events = {}
+    # Token bucket: per key зберігаємо (tokens, last_refill) — O(1) на виклик.
+    # LRU: тримаємо не більше max_keys ключів, найстаріші викидаємо
+    # (бакет, який довго не чіпали, і так повний — втрати точності нема).
+    # Ключі розкладені по шардах, кожен зі своїм lock — гарячі ключі
+    # не блокують весь лімітер.
+    SHARDS = 64
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys_per_shard = max(1, max_keys // self.SHARDS)
+        self._buckets: list[OrderedDict[str, tuple[float, float]]] = [OrderedDict() for _ in range(self.SHARDS)]
+        self._locks = [threading.Lock() for _ in range(self.SHARDS)]
 
     def allow(self, key: str, limit: int, per_seconds: int) -> bool:
-        now = datetime.utcnow()
-        arr = self._events.get(key, [])
-        arr = [t for t in arr if now - t < timedelta(seconds=per_seconds)]
-        if len(arr) >= limit:
-            self._events[key] = arr
-            return False
-        arr.append(now)
-        self._events[key] = arr
-        return True
+        i = hash(key) & (self.SHARDS - 1)
+        buckets = self._buckets[i]
+        rate = limit / per_seconds
+        with self._locks[i]:
+            now = time.monotonic()
+            tokens, last = buckets.get(key, (float(limit), now))
+            tokens = min(float(limit), tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            buckets[key] = (tokens - 1 if allowed else tokens, now)
+            buckets.move_to_end(key)
+            if len(buckets) > self.max_keys_per_shard:
+                buckets.popitem(last=False)
+        return allowed
+
+    async def allow_async(self, key: str, limit: int, per_seconds: int) -> bool:
+        # Критична секція без await і дуже коротка — asyncio.Lock тут не потрібен,
+        # threading.Lock шарда не тримається через межу await.
+        return self.allow(key, limit, per_seconds)
 
 rate_limiter = SimpleRateLimit()
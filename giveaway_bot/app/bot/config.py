@@ -1,17 +1,30 @@
 import os
-from pathlib import Path
-from dotenv import load_dotenv
+import secrets
+from ..env import load as _load_env
 
-# Load .env reliably both locally and on server (regardless of current working directory)
-BASE_DIR = Path(__file__).resolve().parents[2]  # .../giveaway_bot
-ENV_PATH = BASE_DIR / ".env"
-load_dotenv(ENV_PATH if ENV_PATH.exists() else None)
+_load_env()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 
+# Webhook mode: set WEBHOOK_URL (public https base, e.g. https://bot.example.com).
+# Empty -> long polling.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/tg").strip() or "/tg"
+# Telegram sends it back in X-Telegram-Bot-Api-Secret-Token; without it anyone could
+# POST forged updates to WEBHOOK_PATH. set_webhook runs on every start, so a random
+# per-process secret works when none is configured.
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip() or secrets.token_urlsafe(32)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+def _parse_ids(raw: str) -> frozenset[int]:
+    # malformed tokens are skipped; at most one leading "-" (group/channel ids)
+    ids = set()
+    for t in raw.replace(" ", "").split(","):
+        digits = t[1:] if t.startswith("-") else t
+        if digits.isascii() and digits.isdigit():
+            ids.add(int(t))
+    return frozenset(ids)
+
 # ADMIN_IDS=123,456 у .env
-ADMIN_IDS = set(
-    int(x.strip())
-    for x in os.getenv("ADMIN_IDS", "").split(",")
-    if x.strip().isdigit()
-)
+ADMIN_IDS: frozenset[int] = _parse_ids(os.getenv("ADMIN_IDS", ""))
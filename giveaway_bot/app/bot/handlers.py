@@ -1,76 +1,124 @@
 # app/bot/handlers.py
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime
+from functools import lru_cache, partial
+import logging
 import re
-from typing import Dict, Optional, Tuple
+from typing import Optional, Tuple
 
 from aiogram import Router, F
+from cachetools import LRUCache, TTLCache
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 
-from sqlalchemy import select
+from sqlalchemy import select, update, case
 from sqlalchemy.exc import IntegrityError
 
-from ..db import SessionLocal
-from ..models import Giveaway, Participant, Referral, PromoCode, PromoUse
+from ..db import AsyncSessionLocal
+from ..models import Giveaway, Participant, Referral, PromoCode, PromoUse, bulk_add_participants
 from .config import ADMIN_IDS
 from .keyboards import (
     role_choice_kb, admin_root_kb, user_root_kb,
     giveaway_kb, admin_giveaway_kb, confirm_delete_kb
 )
+from .sender import sender
 
 router = Router()
+log = logging.getLogger(__name__)
 
 # ------------------------
 # Runtime per-user mode (in memory)
 # ------------------------
-USER_MODE: Dict[int, str] = {}  # "admin" | "user"
+# user_id -> True if switched to admin mode; bounded so it can't grow forever
+USER_MODE: LRUCache = LRUCache(maxsize=100_000)
 
 def is_admin(user_id: int) -> bool:
-    return user_id in set(ADMIN_IDS or [])
+    return user_id in ADMIN_IDS  # frozenset, built once in config
 
-def mode_of(user_id: int) -> str:
-    return USER_MODE.get(user_id, "user")
+def in_admin_mode(message_or_cb) -> bool:
+    """Admin id AND currently switched to admin mode (one attribute chain, no extra calls)."""
+    uid = message_or_cb.from_user.id
+    return USER_MODE.get(uid, False) and uid in ADMIN_IDS
 
 # ------------------------
 # Helpers
 # ------------------------
 _CODE_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_TME_RE = re.compile(r"(?:https?://)?(?:t\.me|telegram\.me)/([A-Za-z0-9_]{5,32})")
+_UNAME_RE = re.compile(r"[A-Za-z0-9_]{5,32}")
 
 def valid_code(code: str) -> bool:
     return bool(_CODE_RE.match(code))
 
-_BOT_USERNAME_CACHE: Optional[str] = None
+# One shared future: concurrent first callers all wait on a single getMe call
+_BOT_USERNAME_FUT: Optional[asyncio.Future[str]] = None
 
 async def bot_username(message_or_cb) -> str:
-    global _BOT_USERNAME_CACHE
-    if _BOT_USERNAME_CACHE:
-        return _BOT_USERNAME_CACHE
-    me = await message_or_cb.bot.get_me()
-    _BOT_USERNAME_CACHE = me.username or ""
-    return _BOT_USERNAME_CACHE
+    global _BOT_USERNAME_FUT
+    fut = _BOT_USERNAME_FUT
+    if fut is None:
+        fut = _BOT_USERNAME_FUT = asyncio.get_running_loop().create_future()
+        try:
+            me = await message_or_cb.bot.get_me()
+        except BaseException as e:
+            # don't cache failures — next call retries. Cancellation too, or the
+            # callers already waiting on the future would hang forever.
+            _BOT_USERNAME_FUT = None
+            fut.set_exception(e if isinstance(e, Exception) else RuntimeError("getMe was interrupted"))
+            fut.exception()  # mark retrieved: this caller re-raises e itself
+            raise
+        fut.set_result(me.username or "")
+    return await fut
 
 def now_local() -> datetime:
     # naive local time is fine for a single-server bot; store naive in DB.
     return datetime.now()
 
-def deactivate_if_expired(db, g: Giveaway) -> bool:
-    """Return True if expired and deactivated."""
+@lru_cache(maxsize=1024)
+def fmt_ends(dt: datetime) -> str:
+    # the same deadlines are rendered over and over on the menu
+    return dt.strftime("%Y-%m-%d %H:%M")
+
+async def sweep_expired(db) -> None:
+    """Deactivate every expired giveaway with one UPDATE and one commit."""
+    await db.execute(
+        update(Giveaway)
+        .where(Giveaway.is_active == True, Giveaway.ends_at.is_not(None), Giveaway.ends_at <= now_local())
+        .values(is_active=False)
+    )
+    await db.commit()
+
+async def deactivate_if_expired(db, g: Giveaway) -> bool:
+    """Return True if expired and deactivated (sweeps all expired giveaways at once)."""
     if g.is_active and g.ends_at and g.ends_at <= now_local():
-        g.is_active = False
-        db.commit()
+        await sweep_expired(db)
         return True
     return False
 
+# (chat, user_id) -> chat member status. Only successful lookups are cached,
+# so repeated button presses don't hit getChatMember every time.
+_MEMBER_STATUS: TTLCache = TTLCache(maxsize=4096, ttl=30)
+
+async def member_status(bot, chat_username: str, user_id: int) -> Optional[str]:
+    key = (chat_username, user_id)
+    status = _MEMBER_STATUS.get(key)
+    if status is None:
+        m = await bot.get_chat_member(chat_username, user_id)
+        status = getattr(m, "status", None)
+        if status is not None:
+            _MEMBER_STATUS[key] = status
+    return status
+
 async def ensure_subscribed(bot, user_id: int, chat_username: str) -> bool:
     """Check membership for channel/group. Returns True if subscribed/participant."""
     try:
-        m = await bot.get_chat_member(chat_username, user_id)
+        status = await member_status(bot, chat_username, user_id)
         # statuses: creator/administrator/member/restricted/left/kicked
-        return m.status in ("creator", "administrator", "member", "restricted")
+        return status in ("creator", "administrator", "member", "restricted")
     except Exception:
         # If bot has no access OR chat invalid, treat as not subscribed
         return False
@@ -79,11 +127,11 @@ def parse_ref_payload(payload: str) -> Optional[Tuple[int, int]]:
     # payload like: ref_<gid>_<inviterId>
     if not payload.startswith("ref_"):
         return None
-    try:
-        _, gid, inviter = payload.split("_", 2)
-        return int(gid), int(inviter)
-    except Exception:
+    gid, _, inviter = payload[4:].partition("_")
+    inviter_digits = inviter[1:] if inviter.startswith("-") else inviter  # at most one sign
+    if not (gid.isascii() and gid.isdigit() and inviter_digits.isascii() and inviter_digits.isdigit()):
         return None
+    return int(gid), int(inviter)
 
 # ------------------------
 # FSM\
@@ -92,6 +140,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+@lru_cache(maxsize=4096)
 def join_link_kb(channel_username: str, gid: int) -> InlineKeyboardMarkup:
     url = f"https://t.me/{channel_username.lstrip('@')}"
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -111,8 +160,7 @@ async def check_subscription_soft(bot, user_id: int, channel_username: str):
         return True  # перевірка не потрібна
 
     try:
-        m = await bot.get_chat_member(channel_username, user_id)
-        status = getattr(m, "status", None)
+        status = await member_status(bot, channel_username, user_id)
         # member/administrator/creator — ок; left/kicked — ні
         return status in ("member", "administrator", "creator")
     except Exception:
@@ -141,21 +189,18 @@ class RedeemPromo(StatesGroup):
 @router.message(Command("start"))
 async def start(message: Message):
     # default: user mode
-    USER_MODE[message.from_user.id] = "user"
+    USER_MODE[message.from_user.id] = False
 
     parts = (message.text or "").split(maxsplit=1)
     payload = parts[1].strip() if len(parts) > 1 else ""
 
     # ✅ якщо це рефералка — НЕ показуємо вибір режиму
     if payload.startswith("ref_"):
-        # ref формат: ref_<giveaway_id>_<referrer_id>
-        try:
-            _, gid_str, referrer_str = payload.split("_", 2)
-            gid = int(gid_str)
-            referrer_id = int(referrer_str)
-        except Exception:
+        parsed = parse_ref_payload(payload)
+        if parsed is None:
             await message.answer("⚠️ Некоректне реферальне посилання.", reply_markup=user_root_kb())
             return
+        gid, referrer_id = parsed
 
         # якщо користувач сам собі реферер — просто ігноруємо
         if referrer_id == message.from_user.id:
@@ -175,80 +220,98 @@ async def start(message: Message):
 @router.message(F.text == "🛠 Адмін")
 async def switch_admin(message: Message):
     if not is_admin(message.from_user.id):
-        USER_MODE[message.from_user.id] = "user"
+        USER_MODE[message.from_user.id] = False
         await message.answer("⛔ Вибачте, ви не адміністратор.", reply_markup=user_root_kb())
         return
-    USER_MODE[message.from_user.id] = "admin"
+    USER_MODE[message.from_user.id] = True
     await message.answer("🛠 Адмін меню:", reply_markup=admin_root_kb())
 
 @router.message(F.text == "👤 Користувач")
 async def switch_user(message: Message):
-    USER_MODE[message.from_user.id] = "user"
+    USER_MODE[message.from_user.id] = False
     await message.answer("👤 Меню користувача:", reply_markup=user_root_kb())
 
 # ------------------------
 # SHOW ACTIVE GIVEAWAYS
 # ------------------------
+_CARD_TPL = (
+    "🎁 <b>{title}</b>\n\n"
+    "{desc}\n\n"
+    "🏆 Переможців: <b>{winners}</b>\n"
+    "⏳ Дедлайн: <b>{ends}</b>\n"
+    "{channel}"
+    "Участь: {joined}"
+)
+_CARD_CHANNEL_TPL = "📣 Канал/група: {}\n"
+
 @router.message(F.text == "🎁 Активні розіграші")
 async def show_active_giveaways(message: Message):
-    mode = mode_of(message.from_user.id)
-    with SessionLocal() as db:
-        giveaways = (
-            db.execute(select(Giveaway).order_by(Giveaway.id.desc()))
-            .scalars()
-            .all()
-        )
-
-        # filter to active + not expired (and auto-deactivate if expired)
-        active = []
-        for g in giveaways:
-            if deactivate_if_expired(db, g):
-                continue
-            if g.is_active:
-                active.append(g)
+    admin_view = in_admin_mode(message)
+    async with AsyncSessionLocal() as db:
+        # auto-deactivate expired giveaways in one UPDATE (not a commit per row)
+        await sweep_expired(db)
+
+        # plain rows with just the card fields — no ORM objects
+        active = (await db.execute(
+            select(
+                Giveaway.id,
+                Giveaway.title,
+                Giveaway.description,
+                Giveaway.winners_count,
+                Giveaway.ends_at,
+                Giveaway.channel_username,
+            )
+            .where(Giveaway.is_active == True)
+            .order_by(Giveaway.id.desc())
+        )).all()
+
+        # participation status for all cards in one query
+        joined_ids = set()
+        if active:
+            joined_ids = set(
+                (await db.execute(
+                    select(Participant.giveaway_id).where(
+                        Participant.user_id == message.from_user.id,
+                        Participant.giveaway_id.in_([g.id for g in active])
+                    )
+                )).scalars()
+            )
 
     if not active:
         await message.answer("Немає активних розіграшів.")
         return
 
+    cards = []
     for g in active:
-        # participation status
-        with SessionLocal() as db:
-            p = (
-                db.execute(
-                    select(Participant).where(
-                        Participant.giveaway_id == g.id,
-                        Participant.user_id == message.from_user.id
-                    )
-                )
-                .scalars()
-                .first()
-            )
-        joined = bool(p)
-
-        ends = g.ends_at.strftime("%Y-%m-%d %H:%M") if g.ends_at else "—"
-
-        text = (
-            f"🎁 <b>{g.title}</b>\n\n"
-            f"{g.description or ''}\n\n"
-            f"🏆 Переможців: <b>{g.winners_count}</b>\n"
-            f"⏳ Дедлайн: <b>{ends}</b>\n"
+        joined = g.id in joined_ids
+
+        text = _CARD_TPL.format(
+            title=g.title,
+            desc=g.description or "",
+            winners=g.winners_count,
+            ends=fmt_ends(g.ends_at) if g.ends_at else "—",
+            channel=_CARD_CHANNEL_TPL.format(g.channel_username) if g.channel_username else "",
+            joined="✅" if joined else "❌",
         )
-        if g.channel_username:
-            text += f"📣 Канал/група: {g.channel_username}\n"
-        text += f"Участь: {'✅' if joined else '❌'}"
 
-        if mode == "admin" and is_admin(message.from_user.id):
-            await message.answer(text, reply_markup=admin_giveaway_kb(g.id), parse_mode="HTML")
-        else:
-            await message.answer(text, reply_markup=giveaway_kb(g.id), parse_mode="HTML")
+        kb = admin_giveaway_kb(g.id) if admin_view else giveaway_kb(g.id)
+        cards.append((text, kb))
+
+    # send all cards concurrently instead of one round-trip after another
+    results = await asyncio.gather(
+        *(sender.send(partial(message.answer, text, reply_markup=kb, parse_mode="HTML")) for text, kb in cards),
+        return_exceptions=True,
+    )
+    for r in results:
+        if isinstance(r, Exception):
+            log.warning("Failed to send giveaway card: %s", r)
 
 # ------------------------
 # ADMIN: CREATE GIVEAWAY
 # ------------------------
 @router.message(F.text == "➕ Створити новий розіграш")
 async def admin_create_giveaway(message: Message, state: FSMContext):
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await message.answer("⛔ Доступ тільки для адміна.", reply_markup=user_root_kb())
         return
     await state.clear()
@@ -257,7 +320,7 @@ async def admin_create_giveaway(message: Message, state: FSMContext):
 
 @router.message(CreateGiveaway.title)
 async def create_giveaway_title(message: Message, state: FSMContext):
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await state.clear()
         return
     title = (message.text or "").strip()
@@ -270,7 +333,7 @@ async def create_giveaway_title(message: Message, state: FSMContext):
 
 @router.message(CreateGiveaway.description)
 async def create_giveaway_description(message: Message, state: FSMContext):
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await state.clear()
         return
     desc = (message.text or "").strip()
@@ -282,7 +345,7 @@ async def create_giveaway_description(message: Message, state: FSMContext):
 
 @router.message(CreateGiveaway.ends_at)
 async def create_giveaway_deadline(message: Message, state: FSMContext):
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await state.clear()
         return
     txt = (message.text or "").strip()
@@ -297,7 +360,7 @@ async def create_giveaway_deadline(message: Message, state: FSMContext):
 
 @router.message(CreateGiveaway.winners)
 async def create_giveaway_winners(message: Message, state: FSMContext):
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await state.clear()
         return
     txt = (message.text or "").strip()
@@ -318,14 +381,14 @@ def normalize_chat_input(text: str) -> Optional[str]:
         return ""
 
     # extract first t.me/... or telegram.me/...
-    m = re.search(r"(https?://)?(t\.me|telegram\.me)/([A-Za-z0-9_]{5,32})", t)
+    m = _TME_RE.search(t)
     if m:
-        return "@" + m.group(3)
+        return "@" + m.group(1)
 
     # plain @username
     if t.startswith("@"):
         u = t[1:]
-        if re.fullmatch(r"[A-Za-z0-9_]{5,32}", u):
+        if _UNAME_RE.fullmatch(u):
             return "@" + u
         return None
 
@@ -335,7 +398,7 @@ def normalize_chat_input(text: str) -> Optional[str]:
 @router.message(CreateGiveaway.channel)
 async def create_giveaway_channel(message: Message, state: FSMContext):
     # admin-only
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await state.clear()
         return
 
@@ -396,9 +459,9 @@ async def create_giveaway_channel(message: Message, state: FSMContext):
         is_active=True,
     )
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         db.add(g)
-        db.commit()
+        await db.commit()
         gid = g.id
 
     await state.update_data(giveaway_id=gid)
@@ -416,7 +479,7 @@ async def create_giveaway_channel(message: Message, state: FSMContext):
 
 @router.message(CreateGiveaway.promo)
 async def create_giveaway_promo(message: Message, state: FSMContext):
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await state.clear()
         return
 
@@ -444,13 +507,13 @@ async def create_giveaway_promo(message: Message, state: FSMContext):
 
     gid = int((await state.get_data())["giveaway_id"])
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         pc = PromoCode(giveaway_id=gid, code=code, max_uses=mu, uses=0, is_active=True)
         db.add(pc)
         try:
-            db.commit()
+            await db.commit()
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             await message.answer("❌ Такий промокод вже існує для цього розіграшу.")
             return
 
@@ -462,7 +525,7 @@ async def create_giveaway_promo(message: Message, state: FSMContext):
 # ------------------------
 @router.callback_query(F.data.startswith("adm_code:"))
 async def admin_create_code_from_card(cb: CallbackQuery, state: FSMContext):
-    if mode_of(cb.from_user.id) != "admin" or not is_admin(cb.from_user.id):
+    if not in_admin_mode(cb):
         await cb.answer("⛔ Доступ заборонено", show_alert=True)
         return
     gid = int(cb.data.split(":")[1])
@@ -474,7 +537,7 @@ async def admin_create_code_from_card(cb: CallbackQuery, state: FSMContext):
 
 @router.message(CreatePromo.value)
 async def admin_create_code_value(message: Message, state: FSMContext):
-    if mode_of(message.from_user.id) != "admin" or not is_admin(message.from_user.id):
+    if not in_admin_mode(message):
         await state.clear()
         return
 
@@ -497,13 +560,13 @@ async def admin_create_code_value(message: Message, state: FSMContext):
 
     gid = int((await state.get_data())["giveaway_id"])
 
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         pc = PromoCode(giveaway_id=gid, code=code, max_uses=mu, uses=0, is_active=True)
         db.add(pc)
         try:
-            db.commit()
+            await db.commit()
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             await message.answer("❌ Такий промокод вже існує для цього розіграшу.")
             return
 
@@ -512,14 +575,14 @@ async def admin_create_code_value(message: Message, state: FSMContext):
 
 @router.callback_query(F.data.startswith("adm_codes:"))
 async def admin_list_codes(cb: CallbackQuery):
-    if mode_of(cb.from_user.id) != "admin" or not is_admin(cb.from_user.id):
+    if not in_admin_mode(cb):
         await cb.answer("⛔ Доступ заборонено", show_alert=True)
         return
 
     gid = int(cb.data.split(":")[1])
-    with SessionLocal() as db:
+    async with AsyncSessionLocal() as db:
         codes = (
-            db.execute(select(PromoCode).where(PromoCode.giveaway_id == gid).order_by(PromoCode.id.desc()))
+            (await db.execute(select(PromoCode).where(PromoCode.giveaway_id == gid).order_by(PromoCode.id.desc())))
             .scalars()
             .all()
         )
@@ -543,7 +606,7 @@ async def admin_list_codes(cb: CallbackQuery):
 # ------------------------
 @router.callback_query(F.data.startswith("del:"))
 async def admin_delete_ask(cb: CallbackQuery):
-    if mode_of(cb.from_user.id) != "admin" or not is_admin(cb.from_user.id):
+    if not in_admin_mode(cb):
         await cb.answer("⛔ Доступ заборонено", show_alert=True)
         return
     gid = int(cb.data.split(":")[1])
@@ -552,15 +615,15 @@ async def admin_delete_ask(cb: CallbackQuery):
 
 @router.callback_query(F.data.startswith("del_ok:"))
 async def admin_delete_ok(cb: CallbackQuery):
-    if mode_of(cb.from_user.id) != "admin" or not is_admin(cb.from_user.id):
+    if not in_admin_mode(cb):
         await cb.answer("⛔ Доступ заборонено", show_alert=True)
         return
     gid = int(cb.data.split(":")[1])
-    with SessionLocal() as db:
-        g = db.get(Giveaway, gid)
+    async with AsyncSessionLocal() as db:
+        g = await db.get(Giveaway, gid)
         if g:
             g.is_active = False
-            db.commit()
+            await db.commit()
     await cb.message.answer("🗑 Розіграш видалено (деактивовано).")
     await cb.answer()
 
@@ -572,105 +635,133 @@ async def admin_delete_cancel(cb: CallbackQuery):
 # USER: JOIN / REF / REDEEM
 # ------------------------
 
-async def register_participation(cb: CallbackQuery, gid: int):
-    with SessionLocal() as db:
-        g = db.get(Giveaway, gid)
-        if not g:
-            await cb.answer("Розіграш не знайдено", show_alert=True)
-            return
-        if deactivate_if_expired(db, g) or not g.is_active:
-            await cb.answer("⛔ Розіграш завершено.", show_alert=True)
-            return
-
-    with SessionLocal() as db:
-        p = Participant(
-            giveaway_id=gid,
-            user_id=cb.from_user.id,
-            username=cb.from_user.username or "",
-            first_name=cb.from_user.first_name or "",
-            tickets=1,
-            invited_count=0
-        )
-        db.add(p)
-        try:
-            db.commit()
-        except IntegrityError:
-            db.rollback()
-            await cb.answer("✅ Ви вже берете участь.", show_alert=False)
-            return
+async def open_giveaway_or_answer(db, cb: CallbackQuery, gid: int) -> Optional[Giveaway]:
+    """Return the giveaway if it can be joined, otherwise answer the callback and return None."""
+    g = await db.get(Giveaway, gid)
+    if not g:
+        await cb.answer("Розіграш не знайдено", show_alert=True)
+        return None
+    if await deactivate_if_expired(db, g) or not g.is_active:
+        await cb.answer("⛔ Розіграш завершено.", show_alert=True)
+        return None
+    return g
+
+async def add_participant(db, cb: CallbackQuery, gid: int):
+    """Insert the participant (+ referral bonus) using an already open session."""
+    row = dict(
+        giveaway_id=gid,
+        user_id=cb.from_user.id,
+        username=cb.from_user.username or "",
+        first_name=cb.from_user.first_name or "",
+        tickets=1,
+        invited_count=0
+    )
+    try:
+        added = await db.run_sync(bulk_add_participants, [row])
+        await db.commit()
+    except IntegrityError:  # dialects without ON CONFLICT DO NOTHING
+        await db.rollback()
+        added = 0
+    if not added:
+        await cb.answer("✅ Ви вже берете участь.", show_alert=False)
+        return
 
-        # реф-бонус (як у тебе було)
-        r = (
-            db.execute(select(Referral).where(
-                Referral.giveaway_id == gid,
-                Referral.invited_id == cb.from_user.id
-            ))
-            .scalars()
-            .first()
-        )
-        if r and r.inviter_id != cb.from_user.id:
-            inviter = (
-                db.execute(select(Participant).where(
-                    Participant.giveaway_id == gid,
-                    Participant.user_id == r.inviter_id
-                ))
-                .scalars()
-                .first()
+    # реф-бонус (як у тебе було)
+    r = (
+        (await db.execute(select(Referral).where(
+            Referral.giveaway_id == gid,
+            Referral.invited_id == cb.from_user.id
+        )))
+        .scalars()
+        .first()
+    )
+    bonus = False
+    if r and r.inviter_id != cb.from_user.id:
+        # one atomic UPDATE: concurrent invitees can't lose each other's increments;
+        # every 5th invite also adds a ticket (SET sees the old invited_count)
+        invited = (await db.execute(
+            update(Participant)
+            .where(Participant.giveaway_id == gid, Participant.user_id == r.inviter_id)
+            .values(
+                invited_count=Participant.invited_count + 1,
+                tickets=Participant.tickets + case(((Participant.invited_count + 1) % 5 == 0, 1), else_=0),
             )
-            if inviter:
-                inviter.invited_count += 1
-                if inviter.invited_count % 5 == 0:
-                    inviter.tickets += 1
-                    try:
-                        await cb.bot.send_message(
-                            inviter.user_id,
-                            "🎉 +1 шанс! 5 друзів приєднались по вашому посиланню."
-                        )
-                    except Exception:
-                        pass
-                db.commit()
+            .returning(Participant.invited_count)
+        )).scalar()
+        await db.commit()
+        bonus = invited is not None and invited % 5 == 0
 
     await cb.answer("✅ Ви берете участь!", show_alert=False)
 
+    # notify only after commit + answer: the sender queue may hold this for seconds
+    if bonus:
+        try:
+            await sender.send(partial(
+                cb.bot.send_message,
+                r.inviter_id,
+                "🎉 +1 шанс! 5 друзів приєднались по вашому посиланню."
+            ))
+        except Exception:
+            pass
+
+async def register_participation(cb: CallbackQuery, gid: int):
+    # check + insert in one session / one pool checkout
+    async with AsyncSessionLocal() as db:
+        if await open_giveaway_or_answer(db, cb, gid) is None:
+            return
+        await add_participant(db, cb, gid)
+
 
 @router.callback_query(F.data.startswith("join:"))
 async def user_join(cb: CallbackQuery):
     gid = int(cb.data.split(":")[1])
 
-    with SessionLocal() as db:
-        g = db.get(Giveaway, gid)
-        if not g:
-            await cb.answer("Розіграш не знайдено", show_alert=True)
+    async with AsyncSessionLocal() as db:
+        g = await open_giveaway_or_answer(db, cb, gid)
+        if g is None:
             return
-        if deactivate_if_expired(db, g) or not g.is_active:
-            await cb.answer("⛔ Розіграш завершено.", show_alert=True)
+        channel_username = g.channel_username
+
+        # якщо канал не задано — одразу реєструємо (в цій же сесії)
+        if not channel_username:
+            await add_participant(db, cb, gid)
             return
 
     # ФІКТИВНА "ПІДПИСКА": просто показуємо посилання + кнопку "я підписався"
-    if g.channel_username:
-        await cb.message.answer(
-            "📣 Спочатку перейдіть у канал/групу за посиланням, потім натисніть ✅ Я підписався.",
-            reply_markup=join_link_kb(g.channel_username, gid)
-        )
-        await cb.answer()
-        return
+    await cb.message.answer(
+        "📣 Спочатку перейдіть у канал/групу за посиланням, потім натисніть ✅ Я підписався.",
+        reply_markup=join_link_kb(channel_username, gid)
+    )
+    await cb.answer()
 
-    # якщо канал не задано — одразу реєструємо
-    await register_participation(cb, gid)
+
+_GIVEAWAY_STATE: TTLCache = TTLCache(maxsize=1024, ttl=5)
+
+async def giveaway_state(gid: int):
+    """(is_active, ends_at) row or None. Cached for 5s — referral links are read-mostly."""
+    try:
+        return _GIVEAWAY_STATE[gid]
+    except KeyError:
+        pass
+    async with AsyncSessionLocal() as db:
+        state = (await db.execute(
+            select(Giveaway.is_active, Giveaway.ends_at).where(Giveaway.id == gid)
+        )).one_or_none()
+    _GIVEAWAY_STATE[gid] = state
+    return state
 
 
 @router.callback_query(F.data.startswith("ref:"))
 async def user_ref(cb: CallbackQuery):
     gid = int(cb.data.split(":")[1])
 
-    with SessionLocal() as db:
-        g = db.get(Giveaway, gid)
-        if not g or not g.is_active:
-            await cb.answer("Розіграш неактивний", show_alert=True)
-            return
-        if deactivate_if_expired(db, g) or not g.is_active:
-            await cb.answer("⛔ Розіграш завершено.", show_alert=True)
-            return
+    state = await giveaway_state(gid)
+    if not state or not state.is_active:
+        await cb.answer("Розіграш неактивний", show_alert=True)
+        return
+    if state.ends_at and state.ends_at <= now_local():
+        await cb.answer("⛔ Розіграш завершено.", show_alert=True)
+        return
 
     username = await bot_username(cb)
     link = f"https://t.me/{username}?start=ref_{gid}_{cb.from_user.id}"
@@ -715,28 +806,29 @@ async def user_redeem_code(message: Message, state: FSMContext):
         await message.answer("❌ Невірний формат коду.")
         return
 
-    with SessionLocal() as db:
-        g = db.get(Giveaway, gid)
+    async with AsyncSessionLocal() as db:
+        g = await db.get(Giveaway, gid)
         if not g or not g.is_active:
             await state.clear()
             await message.answer("⛔ Розіграш неактивний.")
             return
-        if deactivate_if_expired(db, g) or not g.is_active:
+        if await deactivate_if_expired(db, g) or not g.is_active:
             await state.clear()
             await message.answer("⛔ Дедлайн минув. Розіграш завершено.")
             return
 
-        p = (
-            db.execute(select(Participant).where(Participant.giveaway_id == gid, Participant.user_id == message.from_user.id))
-            .scalars()
-            .first()
-        )
-        if not p:
+        # only need to know the row exists (and its id for the ticket bump)
+        pid = (await db.execute(
+            select(Participant.id)
+            .where(Participant.giveaway_id == gid, Participant.user_id == message.from_user.id)
+            .limit(1)
+        )).scalar()
+        if pid is None:
             await message.answer("Спочатку натисни ✅ Участвую у розіграші.")
             return
 
         pc = (
-            db.execute(select(PromoCode).where(PromoCode.giveaway_id == gid, PromoCode.code == code))
+            (await db.execute(select(PromoCode).where(PromoCode.giveaway_id == gid, PromoCode.code == code)))
             .scalars()
             .first()
         )
@@ -748,16 +840,16 @@ async def user_redeem_code(message: Message, state: FSMContext):
         use = PromoUse(giveaway_id=gid, user_id=message.from_user.id, code=code)
         db.add(use)
         try:
-            db.flush()
+            await db.flush()
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             await state.clear()
             await message.answer("⚠️ Ви вже використовували цей промокод.")
             return
 
         pc.uses += 1
-        p.tickets += 1
-        db.commit()
+        await db.execute(update(Participant).where(Participant.id == pid).values(tickets=Participant.tickets + 1))
+        await db.commit()
 
     await state.clear()
     await message.answer("✅ Промокод прийнято! +1 шанс.")
@@ -1,32 +1,44 @@
 # app/bot/keyboards.py
+from functools import lru_cache
+
 from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
     ReplyKeyboardMarkup, KeyboardButton
 )
 
+# Reply keyboards never change — build them once at import
+ROLE_CHOICE_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="🛠 Адмін"), KeyboardButton(text="👤 Користувач")]],
+    resize_keyboard=True
+)
+
 def role_choice_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="🛠 Адмін"), KeyboardButton(text="👤 Користувач")]],
-        resize_keyboard=True
-    )
+    return ROLE_CHOICE_KB
+
+ADMIN_ROOT_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🎁 Активні розіграші")],
+        [KeyboardButton(text="➕ Створити новий розіграш")],
+    ],
+    resize_keyboard=True
+)
 
 def admin_root_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🎁 Активні розіграші")],
-            [KeyboardButton(text="➕ Створити новий розіграш")],
-        ],
-        resize_keyboard=True
-    )
+    return ADMIN_ROOT_KB
+
+USER_ROOT_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🎁 Активні розіграші")],
+    ],
+    resize_keyboard=True
+)
 
 def user_root_kb():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🎁 Активні розіграші")],
-        ],
-        resize_keyboard=True
-    )
+    return USER_ROOT_KB
 
+# Inline keyboards depend only on gid — build each one once and reuse it
+# (the markups are never mutated after creation).
+@lru_cache(maxsize=1024)
 def giveaway_kb(gid: int):
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -36,6 +48,7 @@ def giveaway_kb(gid: int):
         ]
     )
 
+@lru_cache(maxsize=1024)
 def admin_giveaway_kb(gid: int):
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -45,6 +58,7 @@ def admin_giveaway_kb(gid: int):
         ]
     )
 
+@lru_cache(maxsize=1024)
 def confirm_delete_kb(gid: int):
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -1,51 +1,134 @@
 import asyncio
 import logging
+import sys
+import orjson
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramNetworkError
-from .config import BOT_TOKEN
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from aiogram.utils.backoff import BackoffConfig
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from .config import BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT
 from .handlers import router
-from ..db import Base, engine
+from ..db import engine, init_db
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 
 log = logging.getLogger(__name__)
 
+_db_ready = False
+
+def _orjson_dumps(obj) -> str:
+    # aiogram expects str (form fields), orjson gives bytes
+    return orjson.dumps(obj).decode()
+
+def prepare_db() -> None:
+    # DDL once per process; sync SQLAlchemy, so callers run it in a thread
+    global _db_ready
+    if not _db_ready:
+        init_db(engine)
+        _db_ready = True
+
 async def main():
     if not BOT_TOKEN:
         raise RuntimeError("BOT_TOKEN is empty. Put BOT_TOKEN into .env or environment variables.")
 
-    Base.metadata.create_all(bind=engine)
+    # orjson for every getUpdates batch and outgoing API call
+    session = AiohttpSession(json_loads=orjson.loads, json_dumps=_orjson_dumps, limit=100)
+    # aiogram's connector already caches DNS and keeps connections alive; keep idle
+    # ones to api.telegram.org for 75s (aiohttp default 15s) so bursts skip TLS handshakes
+    session._connector_init["keepalive_timeout"] = 75
 
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
 
-    dp = Dispatcher()
+    # updates run as separate tasks; isolation keeps one chat's updates in order
+    # (the lock is taken before FSM state is read, so handlers see fresh state)
+    dp = Dispatcher(events_isolation=SimpleEventIsolation())
     dp.include_router(router)
 
+    try:
+        # schema check and the webhook call to Telegram don't depend on each other
+        await asyncio.gather(
+            asyncio.to_thread(prepare_db),
+            set_webhook(bot, dp) if WEBHOOK_URL else drop_webhook(bot),
+        )
+        if WEBHOOK_URL:
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        await bot.session.close()
+
+async def set_webhook(bot: Bot, dp: Dispatcher):
+    # Telegram pushes updates to us — no polling round-trips
+    await bot.set_webhook(
+        WEBHOOK_URL + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True,
+    )
+
+async def drop_webhook(bot: Bot):
     # If webhook was ever set, remove it so polling works everywhere (PC + server)
     try:
         await bot.delete_webhook(drop_pending_updates=True)
     except Exception:
         pass
 
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    app = web.Application()
+    # Ack Telegram with 200 right away and run the handler as a task on the loop,
+    # so slow DB work never pushes the webhook response past Telegram's timeout.
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        log.info("Webhook listening on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def run_polling(bot: Bot, dp: Dispatcher):
     try:
+        # pending updates are already dropped by drop_webhook();
+        # polling_timeout is sent as getUpdates timeout= (long poll on Telegram's side)
         await dp.start_polling(
             bot,
-            skip_updates=True,
             allowed_updates=dp.resolve_used_update_types(),
-            polling_timeout=60,
+            polling_timeout=50,
+            # slower, jittered retries on network errors instead of a tight reconnect loop
+            backoff_config=BackoffConfig(min_delay=1.0, max_delay=30.0, factor=1.3, jitter=0.5),
+            # at most this many updates handled at once
+            tasks_concurrency_limit=100,
         )
     except TelegramNetworkError as e:
         # Let the process manager (systemd/pm2/docker) restart it, but keep message clear in logs.
         log.exception("TelegramNetworkError (polling). Check network / proxy / Telegram доступність: %s", e)
         raise
-    finally:
-        await bot.session.close()
+
+def run() -> None:
+    # uvloop: much cheaper event-loop iterations than the default loop (not available on Windows)
+    if sys.platform != "win32":
+        import uvloop
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    asyncio.run(main())
+    run()
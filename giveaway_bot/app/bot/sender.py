@@ -0,0 +1,48 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+
+T = TypeVar("T")
+
+class TelegramSender:
+    """Bot-wide limiter for outgoing calls: token bucket of `rate` calls/s.
+
+    On 429 (RetryAfter) every sender waits out retry_after, then the call is retried.
+    Calls are passed as zero-arg callables so a retry gets a fresh coroutine."""
+
+    def __init__(self, rate: int = 30, retries: int = 1):
+        self.rate = rate
+        self.retries = retries
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()  # FIFO: waiters get tokens in arrival order
+
+    async def _acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def send(self, call: Callable[[], Awaitable[T]]) -> T:
+        for attempt in range(self.retries + 1):
+            await self._acquire()
+            try:
+                return await call()
+            except TelegramRetryAfter as e:
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                if attempt == self.retries:
+                    raise
+
+# Telegram allows ~30 messages/s per bot
+sender = TelegramSender(rate=30)
@@ -1,27 +1,99 @@
+import logging
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy import create_engine, insert, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
-# Load .env reliably both locally and on server
-BASE_DIR = Path(__file__).resolve().parents[1]  # .../giveaway_bot
-ENV_PATH = BASE_DIR / ".env"
-load_dotenv(ENV_PATH if ENV_PATH.exists() else None)
+from .env import BASE_DIR, load as _load_env
 
-def _default_sqlite_url() -> str:
-    db_file = BASE_DIR / "giveaway.sqlite3"
-    # SQLAlchemy expects sqlite:///C:/path on Windows and sqlite:////abs/path on Linux/mac
-    p = db_file.resolve()
-    return f"sqlite:///{p.as_posix()}"
+_load_env()
 
-DB_URL = os.getenv("DB_URL", "").strip() or _default_sqlite_url()
+# SQLAlchemy expects sqlite:///C:/path on Windows and sqlite:////abs/path on Linux/mac
+DEFAULT_DB_URL = f"sqlite:///{(BASE_DIR / 'giveaway.sqlite3').resolve().as_posix()}"
 
+DB_URL = os.getenv("DB_URL", "").strip() or DEFAULT_DB_URL
+
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def _async_url(url: str) -> URL:
+    # Same database, async driver — whatever sync driver DB_URL names (sqlite+pysqlite, postgresql+psycopg2, ...)
+    u = make_url(url)
+    backend = u.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"DB_URL backend {backend!r} is not supported (use sqlite or postgresql)")
+    return u.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}")
+
+# Pool tuning for server databases (SQLite keeps SQLAlchemy's defaults)
+POOL_OPTS = {} if DB_URL.startswith("sqlite") else {
+    "pool_size": 20,
+    "max_overflow": 40,
+    "pool_pre_ping": True,
+    "pool_recycle": 3600,
+}
+
+# Compiled-SQL cache entries per engine (SQLAlchemy default is 500)
+QUERY_CACHE_SIZE = 1200
+
+# Sync engine: only init_db (startup DDL) uses it; queries go through async_engine
 engine = create_engine(
     DB_URL,
-    connect_args={"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
+    connect_args={"check_same_thread": False} if DB_URL.startswith("sqlite") else {},
+    query_cache_size=QUERY_CACHE_SIZE,
+    **POOL_OPTS
+)
+
+# Async engine for the admin panel and bot handlers, so DB I/O doesn't block the event loop
+async_engine = create_async_engine(_async_url(DB_URL), query_cache_size=QUERY_CACHE_SIZE, **POOL_OPTS)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# SQLite tuning, applied once per pooled connection: WAL lets readers run
+# alongside the single writer, busy_timeout waits instead of "database is locked".
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA busy_timeout=5000",
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _set_sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+if DB_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+# Dev check (SQL_CACHE_CHECK=1): warn about statements that can't be cached —
+# one uncacheable construct means SQL is recompiled on every execution.
+def _check_cache_key(state) -> None:
+    if state.statement._generate_cache_key() is None:
+        logging.getLogger(__name__).warning("Uncacheable statement: %s", state.statement)
+
+if os.getenv("SQL_CACHE_CHECK") == "1":
+    event.listen(Session, "do_orm_execute", _check_cache_key)  # sync and async sessions
 
 class Base(DeclarativeBase):
     pass
+
+def init_db(bind) -> None:
+    """Create tables, plus any indexes added to models after their table already existed."""
+    Base.metadata.create_all(bind=bind)
+    # create_all() skips indexes of existing tables — add the missing ones (CREATE INDEX if absent)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+def insert_ignore(model, index_elements: list[str]):
+    """INSERT that silently skips rows hitting the given unique key (SQLite/Postgres)."""
+    if DB_URL.startswith("sqlite"):
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif DB_URL.startswith("postgresql"):
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing(index_elements=index_elements)
@@ -0,0 +1,11 @@
+from functools import cache
+from pathlib import Path
+from dotenv import load_dotenv
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # .../giveaway_bot
+ENV_PATH = BASE_DIR / ".env"
+
+@cache
+def load() -> None:
+    # Load .env reliably both locally and on server — once per process
+    load_dotenv(ENV_PATH if ENV_PATH.exists() else None)
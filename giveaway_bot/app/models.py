@@ -1,7 +1,11 @@
-from sqlalchemy import String, Integer, DateTime, Boolean, ForeignKey, UniqueConstraint, Text
+from sqlalchemy import func, String, Integer, SmallInteger, DateTime, Boolean, ForeignKey, UniqueConstraint, Index, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
-from .db import Base
+from .db import Base, insert_ignore
+
+# CURRENT_TIMESTAMP (UTC) rendered inline in the INSERT: no Python datetime per row.
+# default= too, because tables created before server_default have no DB-side default.
+NOW = func.current_timestamp()
 
 class Giveaway(Base):
     __tablename__ = "giveaways"
@@ -12,7 +16,7 @@ class Giveaway(Base):
     channel_username: Mapped[str] = mapped_column(String(128), default="")  # optional: @channel
     ends_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=NOW, server_default=NOW)
 
 class Participant(Base):
     __tablename__ = "participants"
@@ -21,9 +25,9 @@ class Participant(Base):
     user_id: Mapped[int] = mapped_column(Integer)  # telegram user id
     username: Mapped[str] = mapped_column(String(128), default="")
     first_name: Mapped[str] = mapped_column(String(128), default="")
-    tickets: Mapped[int] = mapped_column(Integer, default=1)
+    tickets: Mapped[int] = mapped_column(SmallInteger, default=1)
     invited_count: Mapped[int] = mapped_column(Integer, default=0)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=NOW, server_default=NOW)
 
     __table_args__ = (UniqueConstraint("giveaway_id", "user_id", name="uq_participant"),)
 
@@ -34,7 +38,10 @@ class Referral(Base):
     inviter_id: Mapped[int] = mapped_column(Integer)
     invited_id: Mapped[int] = mapped_column(Integer)
 
-    __table_args__ = (UniqueConstraint("giveaway_id", "invited_id", name="uq_invited_once"),)
+    __table_args__ = (
+        UniqueConstraint("giveaway_id", "invited_id", name="uq_invited_once"),
+        Index("ix_ref_giveaway_inviter", "giveaway_id", "inviter_id"),  # invitees of one user
+    )
 
 class PromoCode(Base):
     __tablename__ = "promocodes"
@@ -45,7 +52,10 @@ class PromoCode(Base):
     max_uses: Mapped[int] = mapped_column(Integer, default=1)  # 1 = одноразовий
     uses: Mapped[int] = mapped_column(Integer, default=0)
 
-    __table_args__ = (UniqueConstraint("giveaway_id", "code", name="uq_code"),)
+    __table_args__ = (
+        UniqueConstraint("giveaway_id", "code", name="uq_code"),
+        Index("ix_promocodes_giveaway_id", "giveaway_id", "id"),  # codes list: WHERE giveaway_id ORDER BY id DESC
+    )
 
 class PromoUse(Base):
     __tablename__ = "promouses"
@@ -53,6 +63,19 @@ class PromoUse(Base):
     giveaway_id: Mapped[int] = mapped_column(Integer)
     user_id: Mapped[int] = mapped_column(Integer)
     code: Mapped[str] = mapped_column(String(64))
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=NOW, server_default=NOW)
 
     __table_args__ = (UniqueConstraint("giveaway_id", "user_id", "code", name="uq_user_code"),)
+
+PARTICIPANT_BATCH = 500
+
+def bulk_add_participants(session, rows: list[dict]) -> int:
+    """Insert participants in executemany batches, skipping (giveaway_id, user_id) duplicates.
+
+    Returns how many rows were actually inserted. Caller commits."""
+    stmt = insert_ignore(Participant, ["giveaway_id", "user_id"])
+    conn = session.connection()  # Core executemany, skips the ORM bulk path
+    added = 0
+    for i in range(0, len(rows), PARTICIPANT_BATCH):
+        added += conn.execute(stmt, rows[i:i + PARTICIPANT_BATCH]).rowcount
+    return added
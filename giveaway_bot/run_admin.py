@@ -1,19 +1,36 @@
 import sys
 import os
-from dotenv import load_dotenv
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-# Load .env if present
-env_path = os.path.join(BASE_DIR, ".env")
-load_dotenv(env_path if os.path.exists(env_path) else None)
+from app.env import load as load_env
+
+# Load .env if present (once per process, shared with app modules)
+load_env()
 
 import uvicorn
-from app.admin.admin_app import app
+from app.db import engine, init_db
+import app.models  # noqa: F401  (register tables for init_db)
 
 if __name__ == "__main__":
     host = os.getenv("ADMIN_HOST", "0.0.0.0")
     port = int(os.getenv("ADMIN_PORT", "8000"))
-    uvicorn.run(app, host=host, port=port)
+    workers = int(os.getenv("ADMIN_WORKERS", "") or os.cpu_count() or 1)
+
+    # Create tables once here, not concurrently in every worker's startup
+    if os.getenv("RUN_CREATE_ALL", "1") == "1":
+        init_db(engine)
+        os.environ["RUN_CREATE_ALL"] = "0"
+
+    # workers need the app as an import string; loop="auto" picks uvloop when installed
+    uvicorn.run(
+        "app.admin.admin_app:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop="auto",
+        http="httptools",
+        access_log=False,
+    )
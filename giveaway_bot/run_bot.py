@@ -1,5 +1,4 @@
-from app.bot.main import main
-import asyncio
+from app.bot.main import run
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()